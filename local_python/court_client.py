@@ -7,53 +7,124 @@ via WebSocket, listen for commands, and execute local tasks like recording
 and streaming.
 
 Requirements:
-- Python 3.7+
-- websockets library: pip install websockets
+- Python 3.8+
+- websockets library (13.0+): pip install websockets
+- msgspec library: pip install msgspec
+- uvloop library (optional, Linux/macOS only): pip install uvloop
 - ffmpeg installed and accessible in PATH
 
 Author: Feed Starter Service
 """
 
 import asyncio
-import json
 import logging
 import os
+import re
+import shutil
 import signal
-import subprocess
+import socket
 import sys
 import time
 from datetime import datetime
-from typing import Dict, Optional, Set
-import websockets
+from typing import Dict, List, Optional, Set
+import msgspec
+from websockets.asyncio.client import connect as ws_connect
 from websockets.exceptions import ConnectionClosed, WebSocketException
+from websockets.protocol import State
+
+try:
+    # websockets 15+ connects through the system/env proxy by default
+    from websockets.proxy import get_proxy
+    from websockets.uri import parse_uri
+except ImportError:
+    get_proxy = None
+
+try:
+    import uvloop
+except ImportError:
+    # uvloop is not available on Windows; fall back to the stdlib event loop
+    uvloop = None
+
+# Largest command frame we are willing to parse; real commands are well under 1 KiB
+MAX_CMD_SIZE = 64 * 1024
 
 
 class CourtClient:
     """Court-side client that connects to Feed Starter Service via WebSocket"""
     
+    # Pre-encoded pieces of the success ACK: {"commandId":<id>,"success":true}
+    _ACK_OK_PREFIX = b'{"commandId":'
+    _ACK_OK_SUFFIX = b',"success":true}'
+    # Pre-encoded heartbeat prefix; only the timestamp is formatted per tick
+    _HEARTBEAT_PREFIX = b'{"type":"heartbeat","timestamp":'
+    
+    # ffprobe arguments for the RTSP check; the URL is appended per call.
+    # A small probe size and no stream analysis make ffprobe return quickly.
+    _FFPROBE_ARGV = (
+        "ffprobe",
+        "-rtsp_transport", "tcp",
+        "-probesize", "32768",
+        "-analyzeduration", "0",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height",
+        "-of", "csv=p=0",
+        "-timeout", "10000000",  # 10 second timeout in microseconds
+    )
+    
+    # FFmpeg stderr keyword filters, compiled once and applied to raw bytes
+    _ERR_RE = re.compile(rb'error|failed|invalid|timeout', re.IGNORECASE)
+    # First matching alternative wins, mirroring the error > warning priority
+    _STREAM_LOG_RE = re.compile(
+        rb'^(?:(?=.*?(?P<error>error|failed|invalid|timeout))'
+        rb'|(?=.*?(?P<warning>connection refused|rtmp)))',
+        re.IGNORECASE
+    )
+    
+    # Keep FFmpeg's stderr down to real errors: no banner, no per-second progress stats
+    _FFMPEG_QUIET = ("-hide_banner", "-loglevel", "error", "-nostats")
+    
     def __init__(self, config: Dict):
         self.config = config
         self.ws = None
         self.running = False
-        self.current_processes: Dict[str, subprocess.Popen] = {}
+        self.current_processes: Dict[str, asyncio.subprocess.Process] = {}
+        self.current_tasks: Dict[str, asyncio.Task] = {}
+        self.out_q: Optional[asyncio.Queue] = None  # Created in run() on the running loop
+        self._heartbeat_handle: Optional[asyncio.TimerHandle] = None
         self.logger = self._setup_logging()
         
+        # Reusable JSON encoder/decoder for WebSocket frames
+        self._enc = msgspec.json.Encoder()
+        self._dec = msgspec.json.Decoder()
+        
+        # Registration payload is fixed by config, so encode it once for all reconnects
+        self._reg_frame = self._enc.encode({
+            "courtId": self.config['court_id'],
+            "capabilities": self.config.get('capabilities', ['live', 'record']),
+            "authToken": self.config['auth_token']
+        })
+        
+        # Look up ffmpeg once instead of spawning `ffmpeg -version` per command
+        self._ffmpeg_ok = shutil.which("ffmpeg") is not None
+        if not self._ffmpeg_ok:
+            self.logger.warning("FFmpeg not found in PATH, recording and streaming are unavailable")
+        
+        # Create output directories once at startup
+        self.recordings_dir = self.config.get('recordings_dir', 'recordings')
+        self.logs_dir = f"{self.recordings_dir}/logs"
+        os.makedirs(self.logs_dir, exist_ok=True)
+        
         # Register signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         
     def _setup_logging(self) -> logging.Logger:
         """Setup structured logging with UTC timestamps to match server"""
-        # Set up websockets debug logging
-        websockets_logger = logging.getLogger('websockets')
-        websockets_logger.setLevel(logging.DEBUG)
-        
-        # Enable all websockets logging including frame-level details
-        websockets_client_logger = logging.getLogger('websockets.client')
-        websockets_client_logger.setLevel(logging.DEBUG)
-
-        websockets_protocol_logger = logging.getLogger('websockets.protocol')
-        websockets_protocol_logger.setLevel(logging.DEBUG)
+        # websockets logs every frame at DEBUG, so keep it quiet unless requested
+        ws_log_level = getattr(logging, self.config.get('ws_log_level', 'WARNING').upper())
+        for name in ('websockets', 'websockets.client', 'websockets.protocol'):
+            logging.getLogger(name).setLevel(ws_log_level)
         
         # Configure logging to use UTC timestamps to match the server
         logging.basicConfig(
@@ -77,21 +148,27 @@ class CourtClient:
         uri = f"wss://{self.config['server_host']}:{self.config['server_port']}/ws"
         max_retries = self.config.get('max_retries', 5)
         retry_delay = self.config.get('retry_delay', 5)
+        server_addrs = None  # Resolved once, then reused by every retry
+        
+        # Through a proxy the proxy resolves the server, so skip our own lookup
+        proxy = get_proxy(parse_uri(uri)) if get_proxy is not None else None
+        if proxy:
+            self.logger.debug("Connecting through proxy, server address left to the proxy")
         
         for attempt in range(max_retries):
             try:
                 self.logger.info(f"Connecting to {uri} (attempt {attempt + 1}/{max_retries})")
                 
-                # Connect with settings that work well with Node.js ws library
-                # Disable client-side ping - let server handle ping/pong entirely
-                self.ws = await websockets.connect(
-                    uri,
-                    ping_interval=None,     # Disable client ping - server will ping us
-                    ping_timeout=None,      # Disable client ping timeout
-                    close_timeout=10,
-                    # Additional options to improve compatibility
-                    compression=None        # Disable compression for simpler protocol
-                )
+                if server_addrs is None and not proxy:
+                    addr_info = await asyncio.get_running_loop().getaddrinfo(
+                        self.config['server_host'], self.config['server_port'],
+                        type=socket.SOCK_STREAM
+                    )
+                    # Keep every A/AAAA record so an unreachable one falls through to the next
+                    server_addrs = list(dict.fromkeys(info[4][0] for info in addr_info))
+                    self.logger.debug("Resolved %s to %s", self.config['server_host'], server_addrs)
+                
+                self.ws = await self._open_ws(uri, server_addrs)
                 
                 self.logger.info("WebSocket connection established")
                 self.logger.debug("Server-side ping/pong handling enabled (client ping disabled)")
@@ -106,21 +183,39 @@ class CourtClient:
                     self.logger.error("Max retries exceeded, giving up")
                     return False
     
+    async def _open_ws(self, uri: str, server_addrs: Optional[List[str]]):
+        """Open the WebSocket, trying each resolved server address in turn"""
+        # Connect with settings that work well with Node.js ws library
+        # Disable client-side ping - let server handle ping/pong entirely
+        options = dict(
+            ping_interval=None,     # Disable client ping - server will ping us
+            ping_timeout=None,      # Disable client ping timeout
+            close_timeout=10,
+            max_size=2**20,         # Commands are small; cap frames at 1 MiB
+            # Additional options to improve compatibility
+            compression=None        # Disable compression for simpler protocol
+        )
+        if not server_addrs:
+            return await ws_connect(uri, **options)
+        
+        # TLS SNI and the Host header still use the hostname from the URI
+        for i, addr in enumerate(server_addrs):
+            try:
+                return await ws_connect(uri, host=addr, **options)
+            except (OSError, asyncio.TimeoutError) as e:
+                if i == len(server_addrs) - 1:
+                    raise
+                self.logger.warning(f"Could not reach {addr} ({e}), trying next address")
+    
     async def register(self):
         """Register this court with the central service"""
-        registration_message = {
-            "courtId": self.config['court_id'],
-            "capabilities": self.config.get('capabilities', ['live', 'record']),
-            "authToken": self.config['auth_token']
-        }
-        
-        await self.ws.send(json.dumps(registration_message))
+        await self.ws.send(self._reg_frame)
         self.logger.info(f"Registration sent for court {self.config['court_id']}")
         
         # Wait for registration acknowledgment
         try:
-            response = await asyncio.wait_for(self.ws.recv(), timeout=10)
-            response_data = json.loads(response)
+            response = await asyncio.wait_for(self.ws.recv(decode=False), timeout=10)
+            response_data = self._dec.decode(response)
             
             if response_data.get('type') == 'registration-ack':
                 self.logger.info("Registration acknowledged by server")
@@ -132,20 +227,24 @@ class CourtClient:
         except asyncio.TimeoutError:
             self.logger.error("Registration timeout")
             return False
-        except json.JSONDecodeError as e:
+        except msgspec.DecodeError as e:
             self.logger.error(f"Invalid registration response: {e}")
             return False
     
-    async def handle_message(self, message: str):
+    async def handle_message(self, message: bytes):
         """Handle incoming WebSocket messages"""
         try:
-            data = json.loads(message)
+            if len(message) > MAX_CMD_SIZE:
+                self.logger.warning(f"Dropping oversized message: {len(message)} bytes")
+                return
+            
+            data = self._dec.decode(message)
             command_id = data.get('commandId')
             command = data.get('cmd')
             
             # Add more detailed logging to see what's being received
             self.logger.info(f"Received command: {command} (ID: {command_id})")
-            self.logger.debug(f"Full message data: {data}")
+            self.logger.debug("Full message data: %s", data)
             
             success = False  # Default to False
             
@@ -167,17 +266,20 @@ class CourtClient:
             
             # Send acknowledgment
             if command_id:
-                ack_message = {
-                    "commandId": command_id,
-                    "success": success
-                }
-                if not success:
-                    ack_message["error"] = f"Failed to execute command: {command}"
+                if success:
+                    # Fast path: splice the encoded ID into the static template
+                    ack_frame = self._ACK_OK_PREFIX + self._enc.encode(command_id) + self._ACK_OK_SUFFIX
+                else:
+                    ack_frame = self._enc.encode({
+                        "commandId": command_id,
+                        "success": False,
+                        "error": f"Failed to execute command: {command}"
+                    })
                 
-                await self.ws.send(json.dumps(ack_message))
-                self.logger.info(f"Sent ACK for command {command_id}: {'success' if success else 'failed'}")
+                self._send_nowait(ack_frame)
+                self.logger.info(f"Queued ACK for command {command_id}: {'success' if success else 'failed'}")
                 
-        except json.JSONDecodeError as e:
+        except msgspec.DecodeError as e:
             self.logger.error(f"Invalid message format: {e}")
         except Exception as e:
             self.logger.error(f"Error handling message: {e}")
@@ -193,15 +295,12 @@ class CourtClient:
             
             self.logger.info(f"Recording parameters - duration: {duration}s, quality: {quality}")
             
-            # Create recordings directory
-            recordings_dir = self.config.get('recordings_dir', 'recordings')
-            os.makedirs(recordings_dir, exist_ok=True)
-            self.logger.info(f"Recordings directory: {recordings_dir}")
+            self.logger.info(f"Recordings directory: {self.recordings_dir}")
             
-            # Generate timestamped filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Generate timestamped filename (UTC, like the log timestamps)
+            timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
             user_id = data.get('by', 'unknown')
-            output_file = os.path.join(recordings_dir, f"record_{timestamp}_{user_id}.mp4")
+            output_file = f"{self.recordings_dir}/record_{timestamp}_{user_id}.mp4"
             
             self.logger.info(f"Output file: {output_file}")
             self.logger.info(f"RTSP URL: {self.config['rtsp_url']}")
@@ -215,6 +314,7 @@ class CourtClient:
             # Build ffmpeg command
             ffmpeg_cmd = [
                 "ffmpeg",
+                *self._FFMPEG_QUIET,
                 "-rtsp_transport", "tcp",
                 "-i", self.config['rtsp_url'],
                 "-c:v", "libx264",
@@ -233,11 +333,8 @@ class CourtClient:
             self.logger.info(f"FFmpeg command: {' '.join(ffmpeg_cmd)}")
             
             # Check if ffmpeg is available
-            try:
-                subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
-                self.logger.info("FFmpeg is available")
-            except Exception as e:
-                self.logger.error(f"FFmpeg not available: {e}")
+            if not self._ffmpeg_ok:
+                self.logger.error("FFmpeg not available")
                 return False
             
             # Test RTSP connection before starting recording
@@ -249,24 +346,25 @@ class CourtClient:
             
             self.logger.info(f"Starting recording process...")
             
-            # Add timeout and better error handling for RTSP connection
-            process = subprocess.Popen(
-                ffmpeg_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1
+            # Only stderr is piped; the monitor task reads it asynchronously
+            process = await asyncio.create_subprocess_exec(
+                *ffmpeg_cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
             )
             
             # Store process for potential stopping
             process_key = f"record_{timestamp}"
             self.current_processes[process_key] = process
             
-            # Give FFmpeg a moment to start and check for immediate errors
-            await asyncio.sleep(2)
+            # Give FFmpeg a moment to start; returns early if it exits immediately
+            try:
+                await asyncio.wait_for(process.wait(), timeout=2)
+            except asyncio.TimeoutError:
+                pass
             
             # Check if process is still running
-            if process.poll() is None:
+            if process.returncode is None:
                 self.logger.info(f"Recording started successfully with PID {process.pid}")
                 
                 # Start a background task to monitor the process and log errors
@@ -275,173 +373,124 @@ class CourtClient:
                 return True
             else:
                 # Process already terminated - capture error output
-                stdout, stderr = process.communicate()
+                _, stderr = await process.communicate()
                 self.logger.error(f"Recording process failed immediately:")
                 self.logger.error(f"Return code: {process.returncode}")
-                if stdout:
-                    self.logger.error(f"STDOUT: {stdout}")
                 if stderr:
-                    self.logger.error(f"STDERR: {stderr}")
+                    self.logger.error(f"STDERR: {stderr.decode('utf-8', 'replace')}")
                 
                 # Clean up
-                if process_key in self.current_processes:
-                    del self.current_processes[process_key]
+                self._forget_process(process_key, process)
                 return False
             
         except Exception as e:
             self.logger.error(f"Failed to start recording: {e}")
-            import traceback
-            self.logger.error(f"Traceback: {traceback.format_exc()}")
+            self.logger.debug("START_RECORD traceback", exc_info=True)
             return False
     
-    async def _monitor_stream_process(self, process: subprocess.Popen):
+    @staticmethod
+    async def _read_lines(stream: asyncio.StreamReader):
+        """Yield lines from an FFmpeg pipe, splitting on both \\r and \\n
+        
+        FFmpeg terminates its progress lines with \\r only, so a plain
+        readline() would keep buffering them into one ever-growing line.
+        """
+        pending = b''
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            lines = (pending + chunk).splitlines()
+            pending = b'' if chunk.endswith((b'\n', b'\r')) else lines.pop()
+            for line in lines:
+                yield line
+        if pending:
+            yield pending
+    
+    async def _monitor_stream_process(self, process: asyncio.subprocess.Process):
         """Monitor FFmpeg streaming process and log any errors"""
         try:
             self.logger.info("Starting stream monitoring...")
             
-            # Monitor the process in a non-blocking way
-            while process.poll() is None:
-                # Read some stderr to check for errors
-                if process.stderr and process.stderr.readable():
-                    try:
-                        # Use non-blocking read with a small timeout
-                        import select
-                        import sys
-                        
-                        if hasattr(select, 'select'):
-                            ready, _, _ = select.select([process.stderr], [], [], 1)
-                            if ready:
-                                line = process.stderr.readline()
-                                if line:
-                                    line = line.strip()
-                                    # Log important FFmpeg messages
-                                    if any(keyword in line.lower() for keyword in ['error', 'failed', 'invalid', 'timeout']):
-                                        self.logger.error(f"FFmpeg streaming error: {line}")
-                                    elif 'connection refused' in line.lower() or 'rtmp' in line.lower():
-                                        self.logger.warning(f"FFmpeg streaming info: {line}")
-                                    elif 'input/output error' in line.lower():
-                                        self.logger.error(f"FFmpeg streaming I/O error: {line}")
-                                        break
-                                    elif 'frame=' in line.lower() and len(line) > 50:
-                                        # This is FFmpeg progress output, log occasionally
-                                        if 'fps=' in line.lower():
-                                            self.logger.debug(f"Stream progress: {line}")
-                    except Exception as e:
-                        self.logger.debug(f"Error reading FFmpeg stderr: {e}")
-                
-                await asyncio.sleep(2)
+            # Read stderr as it arrives until FFmpeg closes the pipe
+            async for line in self._read_lines(process.stderr):
+                # Log important FFmpeg messages (I/O errors fall under 'error')
+                match = self._STREAM_LOG_RE.search(line)
+                if match is None:
+                    continue
+                # Only decode lines that are actually logged
+                line = line.strip()
+                if match.lastgroup == 'error':
+                    self.logger.error(f"FFmpeg streaming error: {line.decode('utf-8', 'replace')}")
+                else:
+                    self.logger.warning(f"FFmpeg streaming info: {line.decode('utf-8', 'replace')}")
             
             # Process has ended
-            return_code = process.returncode
+            return_code = await process.wait()
             if return_code != 0:
-                # Get any remaining output
-                try:
-                    stdout, stderr = process.communicate(timeout=5)
-                    if stderr:
-                        self.logger.error(f"FFmpeg streaming process failed with code {return_code}")
-                        self.logger.error(f"Final stderr: {stderr}")
-                    if stdout:
-                        self.logger.info(f"Final stdout: {stdout}")
-                except subprocess.TimeoutExpired:
-                    self.logger.error("FFmpeg streaming process failed and timed out during cleanup")
+                self.logger.error(f"FFmpeg streaming process failed with code {return_code}")
             else:
                 self.logger.info("FFmpeg streaming process completed successfully")
             
-            # Clean up from our tracking
-            if 'live_stream' in self.current_processes:
-                del self.current_processes['live_stream']
-                
         except Exception as e:
             self.logger.error(f"Error monitoring FFmpeg streaming process: {e}")
+        finally:
+            # Clean up from our tracking as soon as the process is reaped
+            self._forget_process('live_stream', process)
     
-    async def _monitor_ffmpeg_process(self, process: subprocess.Popen, process_key: str):
+    async def _monitor_ffmpeg_process(self, process: asyncio.subprocess.Process, process_key: str):
         """Monitor FFmpeg process and log any errors"""
         try:
-            # Monitor the process in a non-blocking way
-            while process.poll() is None:
-                # Read some stderr to check for errors
-                if process.stderr and process.stderr.readable():
-                    try:
-                        # Use non-blocking read with a small timeout
-                        import select
-                        import sys
-                        
-                        if hasattr(select, 'select'):
-                            ready, _, _ = select.select([process.stderr], [], [], 1)
-                            if ready:
-                                line = process.stderr.readline()
-                                if line:
-                                    line = line.strip()
-                                    # Log important FFmpeg messages
-                                    if any(keyword in line.lower() for keyword in ['error', 'failed', 'invalid', 'timeout']):
-                                        self.logger.error(f"FFmpeg error: {line}")
-                                    elif 'Input/output error' in line:
-                                        self.logger.error(f"FFmpeg I/O error: {line}")
-                                        break
-                    except Exception as e:
-                        self.logger.debug(f"Error reading FFmpeg stderr: {e}")
-                
-                await asyncio.sleep(1)
+            # Read stderr as it arrives until FFmpeg closes the pipe
+            async for line in self._read_lines(process.stderr):
+                # Log important FFmpeg messages (I/O errors fall under 'error')
+                if self._ERR_RE.search(line):
+                    self.logger.error(f"FFmpeg error: {line.strip().decode('utf-8', 'replace')}")
             
             # Process has ended
-            return_code = process.returncode
+            return_code = await process.wait()
             if return_code != 0:
-                # Get any remaining output
-                try:
-                    stdout, stderr = process.communicate(timeout=5)
-                    if stderr:
-                        self.logger.error(f"FFmpeg process {process_key} failed with code {return_code}")
-                        self.logger.error(f"Final stderr: {stderr}")
-                except subprocess.TimeoutExpired:
-                    self.logger.error(f"FFmpeg process {process_key} failed and timed out during cleanup")
+                self.logger.error(f"FFmpeg process {process_key} failed with code {return_code}")
             else:
                 self.logger.info(f"FFmpeg process {process_key} completed successfully")
             
-            # Clean up from our tracking
-            if process_key in self.current_processes:
-                del self.current_processes[process_key]
-                
         except Exception as e:
             self.logger.error(f"Error monitoring FFmpeg process {process_key}: {e}")
+        finally:
+            # Clean up from our tracking as soon as the process is reaped
+            self._forget_process(process_key, process)
     
     async def _test_rtsp_connection(self) -> bool:
         """Test RTSP connection with a quick probe"""
         try:
-            # Use ffprobe to test connection quickly
-            test_cmd = [
-                "ffprobe",
-                "-rtsp_transport", "tcp",
-                "-v", "error",
-                "-select_streams", "v:0",
-                "-show_entries", "stream=width,height",
-                "-of", "csv=p=0",
-                "-timeout", "10000000",  # 10 second timeout in microseconds
-                self.config['rtsp_url']
-            ]
-            
-            self.logger.debug(f"Testing RTSP with: {' '.join(test_cmd[:-1])} [RTSP_URL]")
-            
-            # Run the test with timeout
-            result = subprocess.run(
-                test_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=15,  # 15 second timeout for the entire operation
-                universal_newlines=True
+            self.logger.debug("Testing RTSP with: %s [RTSP_URL]", ' '.join(self._FFPROBE_ARGV))
+            
+            # Use ffprobe to test connection quickly, without blocking the event loop
+            process = await asyncio.create_subprocess_exec(
+                *self._FFPROBE_ARGV,
+                self.config['rtsp_url'],
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
             
-            if result.returncode == 0:
+            try:
+                # 15 second timeout for the entire operation
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=15)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self.logger.error("RTSP connection test timed out")
+                return False
+            
+            if process.returncode == 0:
                 self.logger.info("RTSP connection test successful")
                 return True
             else:
-                self.logger.error(f"RTSP connection test failed with code {result.returncode}")
-                if result.stderr:
-                    self.logger.error(f"RTSP test error: {result.stderr.strip()}")
+                self.logger.error(f"RTSP connection test failed with code {process.returncode}")
+                if stderr:
+                    self.logger.error(f"RTSP test error: {stderr.decode('utf-8', 'replace').strip()}")
                 return False
                 
-        except subprocess.TimeoutExpired:
-            self.logger.error("RTSP connection test timed out")
-            return False
         except Exception as e:
             self.logger.error(f"RTSP connection test failed: {e}")
             return False
@@ -449,22 +498,21 @@ class CourtClient:
     async def _handle_stop_record(self, data: Dict) -> bool:
         """Stop all running recordings"""
         try:
-            stopped_count = 0
-            
-            # Stop all recording processes
-            for key, process in list(self.current_processes.items()):
-                if key.startswith('record_') and process.poll() is None:
-                    self.logger.info(f"Stopping recording process {process.pid}")
-                    process.terminate()
-                    
-                    # Wait for graceful termination
-                    try:
-                        process.wait(timeout=10)
-                    except subprocess.TimeoutExpired:
-                        self.logger.warning(f"Force killing recording process {process.pid}")
-                        process.kill()
-                    
-                    del self.current_processes[key]
+            # Stop all recording processes concurrently
+            recordings = [
+                (key, process) for key, process in self.current_processes.items()
+                if key.startswith('record_') and process.returncode is None
+            ]
+            await asyncio.gather(*(
+                self._stop_process(key, process, 'recording') for key, process in recordings
+            ))
+            stopped_count = len(recordings)
+            
+            # Stop all test recording tasks
+            for key, task in list(self.current_tasks.items()):
+                if key.startswith('test_record_'):
+                    self.logger.info(f"Stopping test recording {key}")
+                    task.cancel()
                     stopped_count += 1
             
             self.logger.info(f"Stopped {stopped_count} recording processes")
@@ -474,6 +522,26 @@ class CourtClient:
             self.logger.error(f"Failed to stop recording: {e}")
             return False
     
+    async def _stop_process(self, key: str, process: asyncio.subprocess.Process, kind: str):
+        """Terminate a tracked process, force killing it after 10 seconds"""
+        self.logger.info(f"Stopping {kind} process {process.pid}")
+        process.terminate()
+        
+        # Wait for graceful termination
+        try:
+            await asyncio.wait_for(process.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Force killing {kind} process {process.pid}")
+            process.kill()
+            await process.wait()
+        
+        self._forget_process(key, process)
+    
+    def _forget_process(self, key: str, process: asyncio.subprocess.Process):
+        """Stop tracking a process, unless key has since been reused for a newer one"""
+        if self.current_processes.get(key) is process:
+            del self.current_processes[key]
+    
     async def _handle_start_stream(self, data: Dict) -> bool:
         """Start live streaming to platforms like YouTube"""
         try:
@@ -507,6 +575,7 @@ class CourtClient:
             # Build ffmpeg command for streaming (matching the working hikvision script)
             ffmpeg_cmd = [
                 "ffmpeg",
+                *self._FFMPEG_QUIET,
                 "-rtsp_transport", "tcp",
                 "-i", self.config['rtsp_url'],
                 "-vcodec", "libx264",
@@ -525,11 +594,8 @@ class CourtClient:
             self.logger.info(f"FFmpeg streaming command: {' '.join(ffmpeg_cmd[:-1])} [STREAM_URL]")
             
             # Check if ffmpeg is available
-            try:
-                subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
-                self.logger.info("FFmpeg is available")
-            except Exception as e:
-                self.logger.error(f"FFmpeg not available: {e}")
+            if not self._ffmpeg_ok:
+                self.logger.error("FFmpeg not available")
                 return False
             
             # Test RTSP connection before starting stream
@@ -540,22 +606,23 @@ class CourtClient:
                 return False
             
             self.logger.info(f"Starting live stream process...")
-            process = subprocess.Popen(
-                ffmpeg_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1
+            process = await asyncio.create_subprocess_exec(
+                *ffmpeg_cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
             )
             
             # Store process for potential stopping
             self.current_processes['live_stream'] = process
             
-            # Give FFmpeg a moment to start and check for immediate errors
-            await asyncio.sleep(3)
+            # Give FFmpeg a moment to start; returns early if it exits immediately
+            try:
+                await asyncio.wait_for(process.wait(), timeout=3)
+            except asyncio.TimeoutError:
+                pass
             
             # Check if process is still running
-            if process.poll() is None:
+            if process.returncode is None:
                 self.logger.info(f"Live stream started successfully with PID {process.pid}")
                 
                 # Start a background task to monitor the streaming process
@@ -564,23 +631,19 @@ class CourtClient:
                 return True
             else:
                 # Process already terminated - capture error output
-                stdout, stderr = process.communicate()
+                _, stderr = await process.communicate()
                 self.logger.error(f"Streaming process failed immediately:")
                 self.logger.error(f"Return code: {process.returncode}")
-                if stdout:
-                    self.logger.error(f"STDOUT: {stdout}")
                 if stderr:
-                    self.logger.error(f"STDERR: {stderr}")
+                    self.logger.error(f"STDERR: {stderr.decode('utf-8', 'replace')}")
                 
                 # Clean up
-                if 'live_stream' in self.current_processes:
-                    del self.current_processes['live_stream']
+                self._forget_process('live_stream', process)
                 return False
             
         except Exception as e:
             self.logger.error(f"Failed to start live stream: {e}")
-            import traceback
-            self.logger.error(f"Traceback: {traceback.format_exc()}")
+            self.logger.debug("START_STREAM traceback", exc_info=True)
             return False
     
     async def _handle_stop_stream(self, data: Dict) -> bool:
@@ -588,18 +651,8 @@ class CourtClient:
         try:
             if 'live_stream' in self.current_processes:
                 process = self.current_processes['live_stream']
-                if process.poll() is None:
-                    self.logger.info(f"Stopping live stream process {process.pid}")
-                    process.terminate()
-                    
-                    # Wait for graceful termination
-                    try:
-                        process.wait(timeout=10)
-                    except subprocess.TimeoutExpired:
-                        self.logger.warning(f"Force killing stream process {process.pid}")
-                        process.kill()
-                    
-                    del self.current_processes['live_stream']
+                if process.returncode is None:
+                    await self._stop_process('live_stream', process, 'live stream')
                     self.logger.info("Live stream stopped")
                     return True
             
@@ -617,38 +670,18 @@ class CourtClient:
             duration = meta.get('duration', 30)  # Default 30 seconds for test
             quality = meta.get('quality', '1080p')
             
-            # Create recordings directory
-            recordings_dir = self.config.get('recordings_dir', 'recordings')
-            os.makedirs(recordings_dir, exist_ok=True)
-            
             # Generate timestamped filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
             user_id = data.get('by', 'unknown')
-            output_file = os.path.join(recordings_dir, f"test_record_{timestamp}_{user_id}.txt")
-            
-            # Create a dummy command that writes to a file (no ffmpeg required)
-            test_cmd = [
-                "bash", "-c", 
-                f"echo 'Test recording started at {datetime.now().isoformat()}' > '{output_file}' && "
-                f"for i in {{1..{duration}}}; do "
-                f"echo 'Recording frame $i at' $(date) >> '{output_file}'; "
-                f"sleep 1; "
-                f"done && "
-                f"echo 'Test recording completed at {datetime.now().isoformat()}' >> '{output_file}'"
-            ]
+            output_file = f"{self.recordings_dir}/test_record_{timestamp}_{user_id}.txt"
             
             self.logger.info(f"Starting test recording: {output_file}")
-            process = subprocess.Popen(
-                test_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
             
-            # Store process for potential stopping
-            process_key = f"test_record_{timestamp}"
-            self.current_processes[process_key] = process
+            # Simulate the recording in-process (no ffmpeg required)
+            task_key = f"test_record_{timestamp}"
+            self._start_task(task_key, self._run_test_record(output_file, duration))
             
-            self.logger.info(f"Test recording started with PID {process.pid}")
+            self.logger.info(f"Test recording started as task {task_key}")
             return True
             
         except Exception as e:
@@ -661,89 +694,141 @@ class CourtClient:
             meta = data.get('meta', {})
             platform = meta.get('platform', 'youtube')
             
-            # Create logs directory for test output
-            logs_dir = os.path.join(self.config.get('recordings_dir', 'recordings'), 'logs')
-            os.makedirs(logs_dir, exist_ok=True)
-            
             # Generate timestamped filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = os.path.join(logs_dir, f"test_stream_{timestamp}_{platform}.log")
-            
-            # Create a dummy streaming simulation command
-            test_cmd = [
-                "bash", "-c",
-                f"echo 'Test stream to {platform} started at {datetime.now().isoformat()}' > '{output_file}' && "
-                f"while true; do "
-                f"echo 'Streaming frame at' $(date) >> '{output_file}'; "
-                f"sleep 2; "
-                f"done"
-            ]
+            timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+            output_file = f"{self.logs_dir}/test_stream_{timestamp}_{platform}.log"
             
             self.logger.info(f"Starting test stream to {platform}: {output_file}")
-            process = subprocess.Popen(
-                test_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
             
-            # Store process for potential stopping
-            self.current_processes['test_stream'] = process
+            # Simulate the stream in-process (no ffmpeg required)
+            self._start_task('test_stream', self._run_test_stream(output_file, platform))
             
-            self.logger.info(f"Test stream started with PID {process.pid}")
+            self.logger.info("Test stream started as task test_stream")
             return True
             
         except Exception as e:
             self.logger.error(f"Failed to start test stream: {e}")
             return False
     
-    async def heartbeat_loop(self):
-        """Send periodic heartbeat messages to keep connection alive"""
-        self.logger.info("Starting heartbeat loop with explicit heartbeat messages")
+    def _start_task(self, key: str, coro) -> asyncio.Task:
+        """Start a background task and track it until it finishes"""
+        previous = self.current_tasks.get(key)
+        if previous is not None:
+            previous.cancel()
+        
+        task = asyncio.create_task(coro)
+        self.current_tasks[key] = task
+        
+        def _forget(done: asyncio.Task):
+            if self.current_tasks.get(key) is done:
+                del self.current_tasks[key]
         
+        task.add_done_callback(_forget)
+        return task
+    
+    async def _run_test_record(self, output_file: str, duration: int):
+        """Write one dummy frame line per second to simulate a recording"""
+        with open(output_file, 'w') as f:
+            f.write(f"Test recording started at {datetime.now().isoformat()}\n")
+            f.flush()
+            for i in range(1, duration + 1):
+                f.write(f"Recording frame {i} at {datetime.now().isoformat()}\n")
+                f.flush()
+                await asyncio.sleep(1)
+            f.write(f"Test recording completed at {datetime.now().isoformat()}\n")
+    
+    async def _run_test_stream(self, output_file: str, platform: str):
+        """Write a dummy frame line every two seconds until cancelled"""
+        with open(output_file, 'w') as f:
+            f.write(f"Test stream to {platform} started at {datetime.now().isoformat()}\n")
+            f.flush()
+            while True:
+                f.write(f"Streaming frame at {datetime.now().isoformat()}\n")
+                f.flush()
+                await asyncio.sleep(2)
+    
+    def _schedule_heartbeat(self):
+        """Arm the event loop timer for the next heartbeat"""
         # Send heartbeat more frequently than server timeout (every 4 seconds vs 5s timeout)
         heartbeat_interval = 4
+        self._heartbeat_handle = asyncio.get_running_loop().call_later(
+            heartbeat_interval, self._send_heartbeat
+        )
+    
+    def _send_heartbeat(self):
+        """Timer callback: queue one heartbeat and re-arm the timer"""
+        # Check if connection is still alive
+        if not self.running or self.ws is None or self.ws.state is not State.OPEN:
+            self.logger.info("Heartbeat stopped")
+            return
         
+        # Send a heartbeat message that the server will recognize
+        # This is a workaround for ping/pong compatibility issues
+        self._send_nowait(self._HEARTBEAT_PREFIX + str(time.time()).encode() + b'}')
+        self.logger.debug("Queued heartbeat message for server")
+        self._schedule_heartbeat()
+    
+    def _send_nowait(self, frame: bytes):
+        """Queue an outbound frame for the writer task"""
+        try:
+            self.out_q.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.logger.warning("Outbound queue full, dropping message")
+    
+    async def _writer_loop(self):
+        """Send queued frames, draining everything pending on each wake-up"""
         while self.running and self.ws:
             try:
-                await asyncio.sleep(heartbeat_interval)
-                
-                # Check if connection is still alive
-                if self.ws.closed:
-                    self.logger.warning("WebSocket connection is closed")
-                    break
-                
-                # Send a heartbeat message that the server will recognize
-                # This is a workaround for ping/pong compatibility issues
-                heartbeat_message = {
-                    "type": "heartbeat",
-                    "timestamp": time.time()
-                }
+                frames = [await self.out_q.get()]
+                while True:
+                    try:
+                        frames.append(self.out_q.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
                 
-                await self.ws.send(json.dumps(heartbeat_message))
-                self.logger.debug("Sent heartbeat message to server")
+                # The server parses one JSON document per message, so each
+                # frame stays its own message; they just go out back-to-back
+                for frame in frames:
+                    await self.ws.send(frame)
                     
             except Exception as e:
-                self.logger.error(f"Heartbeat failed: {e}")
+                self.logger.error(f"Outbound send failed: {e}")
                 break
-        
-        self.logger.info("Heartbeat loop stopped")
     
     async def cleanup(self):
         """Clean up resources and stop all processes"""
         self.logger.info("Cleaning up resources...")
         
-        # Stop all running processes
-        for key, process in list(self.current_processes.items()):
-            if process.poll() is None:
-                self.logger.info(f"Terminating process {key} (PID: {process.pid})")
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
+        # Stop all running processes: signal them all, then wait once for the lot
+        running = [
+            (key, process) for key, process in self.current_processes.items()
+            if process.returncode is None
+        ]
+        for key, process in running:
+            self.logger.info(f"Terminating process {key} (PID: {process.pid})")
+            process.terminate()
+        
+        if running:
+            waiters = [asyncio.ensure_future(process.wait()) for _, process in running]
+            _, pending = await asyncio.wait(waiters, timeout=5)
+            
+            # Force kill whatever ignored SIGTERM, then reap it
+            for key, process in running:
+                if process.returncode is None:
+                    self.logger.warning(f"Force killing process {key} (PID: {process.pid})")
                     process.kill()
+            if pending:
+                await asyncio.gather(*pending)
         
         self.current_processes.clear()
         
+        # Cancel all running test tasks
+        for key, task in list(self.current_tasks.items()):
+            self.logger.info(f"Cancelling task {key}")
+            task.cancel()
+        
+        self.current_tasks.clear()
+        
         # Close WebSocket connection
         if self.ws:
             await self.ws.close()
@@ -760,24 +845,18 @@ class CourtClient:
         if not await self.register():
             return False
         
-        # Start heartbeat monitoring task
-        heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        # Start the outbound writer task and the heartbeat timer
+        self.out_q = asyncio.Queue(maxsize=1000)
+        writer_task = asyncio.create_task(self._writer_loop())
+        self.logger.info("Starting heartbeat timer with explicit heartbeat messages")
+        self._schedule_heartbeat()
         
         try:
-            # Use async iteration to handle all frame types
-            async for message in self.ws:
-                if not self.running:
-                    break
-                    
-                # Handle text messages (JSON commands)
-                if isinstance(message, str):
-                    await self.handle_message(message)
-                elif isinstance(message, bytes):
-                    # Binary message (not expected, but handle gracefully)
-                    self.logger.warning(f"Received unexpected binary message: {len(message)} bytes")
-                else:
-                    # This shouldn't happen
-                    self.logger.warning(f"Received unexpected message type: {type(message)}")
+            while self.running:
+                # decode=False returns text frames as raw bytes, skipping the
+                # UTF-8 decode; the JSON decoder validates the payload anyway
+                message = await self.ws.recv(decode=False)
+                await self.handle_message(message)
                     
         except ConnectionClosed:
             self.logger.warning("WebSocket connection closed by server")
@@ -786,9 +865,10 @@ class CourtClient:
         except Exception as e:
             self.logger.error(f"Unexpected error in main loop: {e}")
         finally:
-            heartbeat_task.cancel()
+            self._heartbeat_handle.cancel()
+            writer_task.cancel()
             try:
-                await heartbeat_task
+                await writer_task
             except asyncio.CancelledError:
                 pass
             await self.cleanup()
@@ -808,6 +888,7 @@ def load_config():
         'recordings_dir': os.getenv('RECORDINGS_DIR', 'recordings'),
         'capabilities': ['live', 'record'],
         'log_level': os.getenv('LOG_LEVEL', 'INFO'),
+        'ws_log_level': os.getenv('WS_LOG_LEVEL', 'WARNING'),
         'heartbeat_interval': int(os.getenv('HEARTBEAT_INTERVAL', '10')),  # Reduced to 10 seconds
         'max_retries': int(os.getenv('MAX_RETRIES', '5')),
         'retry_delay': int(os.getenv('RETRY_DELAY', '5'))
@@ -847,5 +928,8 @@ if __name__ == "__main__":
         print("Please install it with: pip install websockets")
         sys.exit(1)
     
-    # Run the client
+    # Run the client, on the libuv-based event loop when available.
+    # uvloop.run() avoids the policy install deprecated on Python 3.12+.
+    if uvloop is not None:
+        sys.exit(uvloop.run(main()))
     sys.exit(asyncio.run(main()))
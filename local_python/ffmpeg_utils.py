@@ -0,0 +1,134 @@
+"""
+Shared FFmpeg helpers for the Hikvision recording/streaming scripts.
+
+Picks a hardware H.264 encoder when one is usable (NVENC, VideoToolbox,
+VAAPI), probes the camera's codecs, and runs ffmpeg as an asyncio
+subprocess so its stderr can be read without blocking the event loop.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Tuple
+
+# VAAPI render node used on Intel/AMD Linux machines
+VAAPI_DEVICE = os.getenv("VAAPI_DEVICE", "/dev/dri/renderD128")
+
+# Upper bound for helper runs (ffmpeg -encoders, ffprobe), in seconds
+PROBE_TIMEOUT = 15
+
+# Sample rates RTMP ingest (YouTube) handles well; anything else is resampled
+PASSTHROUGH_SAMPLE_RATES = ("44100", "48000")
+
+
+async def _run_capture(*argv: str) -> str:
+    """Run a short helper command and return its stdout, or "" if it is missing or times out"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        # e.g. ffprobe not on PATH: callers fall back as if probing failed
+        return ""
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return ""
+    return stdout.decode("utf-8", "replace")
+
+
+async def _ffmpeg_encoders() -> str:
+    """Return the output of `ffmpeg -encoders`"""
+    return await _run_capture("ffmpeg", "-hide_banner", "-encoders")
+
+
+async def pick_h264_encoder() -> str:
+    """Pick the best available H.264 encoder, falling back to libx264
+
+    Set VIDEO_ENCODER to force a specific encoder.
+    """
+    forced = os.getenv("VIDEO_ENCODER")
+    if forced:
+        return forced
+
+    encoders = await _ffmpeg_encoders()
+    if sys.platform == "darwin" and "h264_videotoolbox" in encoders:
+        return "h264_videotoolbox"
+    # Being compiled in is not enough, the hardware has to be present too
+    if "h264_nvenc" in encoders and shutil.which("nvidia-smi"):
+        return "h264_nvenc"
+    if sys.platform.startswith("linux") and "h264_vaapi" in encoders and os.path.exists(VAAPI_DEVICE):
+        return "h264_vaapi"
+    return "libx264"
+
+
+def h264_encoder_args(encoder: str, bitrate: str, software_args: List[str]) -> Tuple[List[str], List[str]]:
+    """Return (global_args, video_args) for the given encoder
+
+    software_args are used as-is for libx264 (or any unknown encoder).
+    """
+    if encoder == "h264_nvenc":
+        return [], ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "cbr", "-b:v", bitrate]
+    if encoder == "h264_videotoolbox":
+        return [], ["-c:v", "h264_videotoolbox", "-b:v", bitrate]
+    if encoder == "h264_vaapi":
+        return (
+            ["-vaapi_device", VAAPI_DEVICE],
+            ["-vf", "format=nv12,hwupload", "-c:v", "h264_vaapi", "-b:v", bitrate]
+        )
+    return [], software_args
+
+
+async def probe_streams(rtsp_url: str) -> Dict[str, Dict[str, str]]:
+    """Probe the camera once and return the first stream of each type
+
+    The result maps codec_type ("video", "audio") to that stream's
+    codec_name/sample_rate. It is empty if the camera could not be probed.
+    """
+    output = await _run_capture(
+        "ffprobe",
+        "-rtsp_transport", "tcp",
+        "-timeout", "10000000",  # 10 second socket timeout in microseconds
+        "-v", "error",
+        "-show_entries", "stream=codec_type,codec_name,sample_rate",
+        "-of", "json",
+        rtsp_url
+    )
+    try:
+        streams = json.loads(output).get("streams", [])
+    except ValueError:
+        return {}
+    result = {}
+    for stream in streams:
+        result.setdefault(stream.get("codec_type"), stream)
+    return result
+
+
+def audio_args(streams: Dict[str, Dict[str, str]], encode_args: List[str]) -> List[str]:
+    """Pass AAC audio through untouched, otherwise encode with encode_args
+
+    streams is the result of probe_streams(). Low-rate AAC (Hikvision often
+    sends 8/16 kHz) is still re-encoded so it gets resampled.
+    """
+    audio = streams.get("audio", {})
+    if audio.get("codec_name") == "aac" and audio.get("sample_rate") in PASSTHROUGH_SAMPLE_RATES:
+        return ["-c:a", "copy"]
+    return encode_args
+
+
+async def run_ffmpeg(cmd: List[str]) -> int:
+    """Run ffmpeg, relaying its stderr to ours, and return its exit code"""
+    process = await asyncio.create_subprocess_exec(*cmd, stderr=asyncio.subprocess.PIPE)
+    while True:
+        chunk = await process.stderr.read(65536)
+        if not chunk:
+            break
+        sys.stderr.buffer.write(chunk)
+        sys.stderr.buffer.flush()
+    return await process.wait()
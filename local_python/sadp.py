@@ -1,69 +1,229 @@
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import html
 import socket
 import os
-import xml.etree.ElementTree as ET
-from prettytable import PrettyTable
-import time
+import re
+import sys
 
-def send_udp_broadcast(packet, port, broadcast_ip):
-    """Send a UDP broadcast packet."""
-    # Mac'te broadcast için belirli bir arayüze bind etmeye gerek yok.
-    # Boş string '' tüm arayüzleri dinlemesini sağlar.
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
+# WS-Discovery Probe Mesajı (bytes olarak hazır, her gönderimde encode edilmez)
+PACKET = b'<?xml version="1.0" encoding="utf-8"?><Probe><Uuid>74F1ED37-5E82-43E8-9A61-66FCD32926E2</Uuid><Types>inquiry</Types></Probe>'
+BROADCAST_IP = "239.255.255.250"
+PORT = 37020
+
+COLUMNS = ["IPV4 Adresi", "MAC Adresi", "Açıklama", "Seri Numarası", "DHCP Aktif"]
+
+# Gerekli alanları XML ağacı kurmadan, ham baytlar üzerinde tek geçişte okur.
+# İsteğe bağlı namespace önekini (ör. <ns:MAC>) ve öznitelikleri atlar.
+# Etiket adı tam eşleşmeli (<MACAddr>, <DHCPEnabled> sayılmaz) ve aynı adla kapanmalı.
+FIELD_RE = re.compile(
+    rb'<(?:\w+:)?(MAC|IPv4Address|DeviceDescription|DeviceSN|DHCP)(?=[\s/>])[^>]*>'
+    rb'([^<]+)</(?:\w+:)?\1\s*>',
+    re.I
+)
+
+# recvmmsg(2) ile tek sistem çağrısında okunacak en fazla paket sayısı ve paket boyutu
+RECV_BATCH = 16
+RECV_SIZE = 24000
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+def _load_recvmmsg():
+    """Return libc's recvmmsg, or None where it is not available (non-Linux)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        func = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    func.restype = ctypes.c_int
+    return func
+
+_recvmmsg = _load_recvmmsg()
+
+class BatchReceiver:
+    """Read up to RECV_BATCH datagrams with a single recvmmsg(2) call (Linux only)."""
+
+    def __init__(self, batch=RECV_BATCH, size=RECV_SIZE):
+        self.buffers = [ctypes.create_string_buffer(size) for _ in range(batch)]
+        self.iovecs = (_IOVec * batch)()
+        self.msgs = (_MMsgHdr * batch)()
+        for i, buf in enumerate(self.buffers):
+            self.iovecs[i].iov_base = ctypes.cast(buf, ctypes.c_void_p)
+            self.iovecs[i].iov_len = size
+            self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            self.msgs[i].msg_hdr.msg_iovlen = 1
+
+    def recv(self, sock):
+        """Return every datagram already queued on sock (up to the batch size) without blocking."""
+        count = _recvmmsg(sock.fileno(), self.msgs, len(self.buffers), MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+        # Sadece gelen bayt kadarını kopyala, 24000 baytlık tamponun tamamını değil
+        return [ctypes.string_at(self.buffers[i], self.msgs[i].msg_len) for i in range(count)]
+
+def open_socket(port):
+    """Open one UDP socket used both to send the probe and to receive replies."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.sendto(packet, (broadcast_ip, port))
-        print("Ağdaki cihazlar için keşif paketi gönderildi. Yanıtlar bekleniyor...")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Çok sayıda cihaz aynı anda yanıt verdiğinde paket kaybolmasın diye büyük alma tamponu
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        # Mac'te broadcast için belirli bir arayüze bind etmeye gerek yok.
+        # Boş string '' tüm arayüzleri dinlemesini sağlar.
+        sock.bind(("", port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def send_udp_broadcast(sock, packet, port, broadcast_ip):
+    """Send a UDP broadcast packet."""
+    sock.sendto(packet, (broadcast_ip, port))
+    print("Ağdaki cihazlar için keşif paketi gönderildi. Yanıtlar bekleniyor...")
+
+def parse_device(data):
+    """Parse one SADP reply and return (mac, info), or None if it is not a device reply."""
+    # Sadece XML verisi olanları işlemeye çalış
+    if not data.strip().startswith(b'<?xml'):
+        return None
+    fields = {}
+    for name, value in FIELD_RE.findall(data):
+        # XPath'teki [1] gibi: aynı alan birden fazla varsa ilki geçerli
+        # &amp;, &lt; gibi XML karakter referanslarını çöz
+        fields.setdefault(name.lower(), html.unescape(value.decode('utf-8', 'replace')))
 
-def listen_for_responses(port, timeout=5):
-    """Listen for UDP packets for a specific duration and return found devices."""
+    # Alanları güvenli bir şekilde bulma (bulunamazsa boş string)
+    mac = fields.get(b'mac', '')
+    desc = fields.get(b'devicedescription', '')
+    sn = fields.get(b'devicesn', '')
+    ipv4 = fields.get(b'ipv4address', '')
+    dhcp = fields.get(b'dhcp', '')
+
+    if not (mac and ipv4):
+        return None
+    return mac, {
+        "IPV4": ipv4,
+        "Description": desc or 'N/A',
+        "Serial": sn or 'N/A',
+        "DHCP": dhcp or 'N/A'
+    }
+
+async def wait_readable(loop, sock):
+    """Wait until sock has data queued, without reading it."""
+    fut = loop.create_future()
+    # Soket okunabilir kaldıkça geri çağrı tekrar tetiklenebilir; sadece ilki sonucu ayarlar
+    loop.add_reader(sock.fileno(), lambda: fut.done() or fut.set_result(None))
+    try:
+        await fut
+    finally:
+        loop.remove_reader(sock.fileno())
+
+async def receive_packets(loop, sock, receiver):
+    """Return the next batch of datagrams from sock."""
+    if receiver is not None:
+        await wait_readable(loop, sock)
+        return receiver.recv(sock)
+    # Gönderen adresine ihtiyaç yok; sock_recv her event loop'ta (Windows dahil) mevcut
+    return [await loop.sock_recv(sock, RECV_SIZE)]
+
+def normalize_mac(mac):
+    """Return mac in one canonical form (lower case, '-' separated) for comparisons."""
+    return mac.strip().lower().replace(':', '-')
+
+async def listen_for_responses(sock, timeout=5, expect_macs=None):
+    """Listen for UDP packets for up to timeout seconds and return found devices.
+
+    If expect_macs is given, return as soon as all of those MACs have replied
+    (case and ':'/'-' separators do not matter).
+    """
+    loop = asyncio.get_running_loop()
     seen_devices = {}
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    expected = {normalize_mac(mac) for mac in expect_macs} if expect_macs else None
+    found = set()
+    # Linux'ta hazır bekleyen paketler tek çağrıda toplu okunur, diğer sistemlerde tek tek.
+    # recvmmsg sadece Linux'ta var; oradaki event loop'lar (selector, uvloop) add_reader destekler.
+    receiver = BatchReceiver() if _recvmmsg is not None else None
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        # Kalan süre kadar bekle; süre dolarsa dinlemeyi bitir
         try:
-            sock.bind(("", port))
-        except OSError as e:
-            print(f"Hata: Port {port} zaten kullanılıyor olabilir. {e}")
-            return
-            
-        sock.settimeout(1.0)  # Her recvfrom için 1 saniye bekle
-        
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                data, addr = sock.recvfrom(24000)
-                # Sadece XML verisi olanları işlemeye çalış
-                if data.strip().startswith(b'<?xml'):
-                    try:
-                        root = ET.fromstring(data.decode('utf-8'))
-                        # XML Namespace'i temizleme (Hikvision bazen ekler)
-                        for elem in root.iter():
-                            if '}' in elem.tag:
-                                elem.tag = elem.tag.split('}', 1)[1]
-
-                        # Alanları güvenli bir şekilde bulma
-                        mac = root.find('.//MAC')
-                        desc = root.find('.//DeviceDescription')
-                        sn = root.find('.//DeviceSN')
-                        ipv4 = root.find('.//IPv4Address')
-                        dhcp = root.find('.//DHCP')
-
-                        if mac is not None and ipv4 is not None:
-                            seen_devices[mac.text] = {
-                                "IPV4": ipv4.text if ipv4 is not None else 'N/A',
-                                "Description": desc.text if desc is not None else 'N/A',
-                                "Serial": sn.text if sn is not None else 'N/A',
-                                "DHCP": dhcp.text if dhcp is not None else 'N/A'
-                            }
-                    except ET.ParseError:
-                        # Geçersiz XML, görmezden gel
-                        continue
-            except socket.timeout:
-                continue
+            packets = await asyncio.wait_for(receive_packets(loop, sock, receiver), remaining)
+        except asyncio.TimeoutError:
+            break
+        for data in packets:
+            device = parse_device(data)
+            if device is not None:
+                mac, info = device
+                seen_devices[mac] = info
+                found.add(normalize_mac(mac))
+        # Beklenen cihazların hepsi bulunduysa süreyi doldurmadan dön
+        if expected and found >= expected:
+            break
 
     return seen_devices
 
-def display_info(devices):
+async def discover(packet, port, broadcast_ip, timeout=5, expect_macs=None):
+    """Send the probe and collect replies on the same socket."""
+    try:
+        sock = open_socket(port)
+    except OSError as e:
+        print(f"Hata: Port {port} zaten kullanılıyor olabilir. {e}")
+        return {}
+
+    with sock:
+        sock.setblocking(False)
+        send_udp_broadcast(sock, packet, port, broadcast_ip)
+        return await listen_for_responses(sock, timeout, expect_macs)
+
+def format_columns(rows):
+    """Format rows as left-aligned plain text columns."""
+    # Sütun genişliklerini tek geçişte hesapla
+    widths = [max(len(cell) for cell in column) for column in zip(*rows)]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+CLEAR_SCREEN = '\x1b[2J\x1b[H'
+
+def clear_screen():
+    """Clear the terminal with an ANSI escape instead of spawning clear/cls."""
+    # Eski cmd.exe ANSI kodlarını anlamaz; Windows Terminal (WT_SESSION) anlar
+    if os.name == 'nt' and not os.environ.get('WT_SESSION'):
+        os.system('cls')
+        return
+    sys.stdout.write(CLEAR_SCREEN)
+    sys.stdout.flush()
+
+def display_info(devices, pretty=False):
     """Display the device information in a table format."""
-    os.system('clear' if os.name == 'posix' else 'cls')
+    clear_screen()
     
     if not devices:
         print("Ağda herhangi bir uyumlu cihaz bulunamadı.")
@@ -73,24 +233,26 @@ def display_info(devices):
         print("- Kodu 'sudo python3 kamera_bul.py' olarak çalıştırmayı deneyin.")
         return
 
-    table = PrettyTable()
-    table.field_names = ["IPV4 Adresi", "MAC Adresi", "Açıklama", "Seri Numarası", "DHCP Aktif"]
-    table.align["IPV4 Adresi"] = "l"
-    table.align["MAC Adresi"] = "l"
-
-    for mac, info in devices.items():
-        table.add_row([info["IPV4"], mac, info["Description"], info["Serial"], info["DHCP"]])
+    rows = [[info["IPV4"], mac, info["Description"], info["Serial"], info["DHCP"]] for mac, info in devices.items()]
 
     print("Bulunan Cihazlar:")
-    print(table)
+    if pretty:
+        # PrettyTable yavaş; sadece --pretty ile istenirse kullan
+        from prettytable import PrettyTable
+        table = PrettyTable()
+        table.field_names = COLUMNS
+        table.align["IPV4 Adresi"] = "l"
+        table.align["MAC Adresi"] = "l"
+        table.add_rows(rows)
+        print(table)
+    else:
+        print(format_columns([COLUMNS] + rows))
 
 
 if __name__ == '__main__':
-    # WS-Discovery Probe Mesajı
-    packet = b'<?xml version="1.0" encoding="utf-8"?><Probe><Uuid>74F1ED37-5E82-43E8-9A61-66FCD32926E2</Uuid><Types>inquiry</Types></Probe>'
-    broadcast_ip = "239.255.255.250"
-    port = 37020
-    
-    send_udp_broadcast(packet, port, broadcast_ip)
-    found_devices = listen_for_responses(port, timeout=5) # 5 saniye dinle
-    display_info(found_devices)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ağdaki Hikvision cihazlarını SADP ile bul.")
+    parser.add_argument("--pretty", action="store_true", help="Sonuçları PrettyTable ile çerçeveli tablo olarak göster")
+    args = parser.parse_args()
+
+    found_devices = asyncio.run(discover(PACKET, PORT, BROADCAST_IP, timeout=5)) # 5 saniye dinle
+    display_info(found_devices, pretty=args.pretty)
\ No newline at end of file